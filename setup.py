@@ -1,24 +1,104 @@
 #!/usr/bin/env python
 
+from functools import lru_cache
 import os
-from pathlib import Path
 import sys
-from typing import Sequence
+from typing import Dict, List, Sequence
 
-from setuptools import setup, find_packages
+from setuptools import setup
 from setuptools.command.build_py import build_py as _build_py
 from setuptools.command.sdist import sdist as _sdist
 
+_HERE = os.path.dirname(os.path.abspath(__file__))
 
+# O_BINARY keeps Windows from translating line endings. It is 0 elsewhere.
+_READ_FLAGS = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+
+# Listed explicitly so setup() need not walk the tree to discover them. Keep this in
+# sync with the subpackages of git/ (git/ext holds the gitdb submodule, not a package).
+_PACKAGES = (
+    "git",
+    "git.index",
+    "git.objects",
+    "git.objects.submodule",
+    "git.refs",
+    "git.repo",
+)
+
+# Also listed explicitly, rather than collected with include_package_data.
+_PACKAGE_DATA = {"git": ["py.typed"]}
+
+_CLASSIFIERS = (
+    # Picked from
+    #   http://pypi.python.org/pypi?:action=list_classifiers
+    # "Development Status :: 1 - Planning",
+    # "Development Status :: 2 - Pre-Alpha",
+    # "Development Status :: 3 - Alpha",
+    # "Development Status :: 4 - Beta",
+    "Development Status :: 5 - Production/Stable",
+    # "Development Status :: 6 - Mature",
+    # "Development Status :: 7 - Inactive",
+    "Environment :: Console",
+    "Intended Audience :: Developers",
+    "License :: OSI Approved :: BSD License",
+    "Operating System :: OS Independent",
+    "Operating System :: POSIX",
+    "Operating System :: Microsoft :: Windows",
+    "Operating System :: MacOS :: MacOS X",
+    "Typing :: Typed",
+    "Programming Language :: Python",
+    "Programming Language :: Python :: 3",
+    "Programming Language :: Python :: 3.7",
+    "Programming Language :: Python :: 3.8",
+    "Programming Language :: Python :: 3.9",
+    "Programming Language :: Python :: 3.10",
+    "Programming Language :: Python :: 3.11",
+    "Programming Language :: Python :: 3.12",
+)
+
+# Options that only print help or a short metadata field. When these are all that is
+# asked for, the README need not be read for the long description.
+_QUERY_OPTIONS = frozenset(
+    (
+        "--author",
+        "--author-email",
+        "--classifiers",
+        "--description",
+        "--fullname",
+        "--help",
+        "--help-commands",
+        "--license",
+        "--name",
+        "--url",
+        "--version",
+        "-h",
+    )
+)
+
+
+@lru_cache(maxsize=None)
 def _read_content(path: str) -> str:
-    return (Path(__file__).parent / path).read_text(encoding="utf-8")
+    fd = os.open(os.path.join(_HERE, path), _READ_FLAGS)
+    try:
+        data = os.read(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    return data.decode("utf-8")
+
+
+def _read_requirements_many(paths: Sequence[str]) -> Dict[str, List[str]]:
+    """Read requirements files, omitting blank lines and comment lines."""
+    requirements_by_path = {}
+    for path in paths:
+        lines = (line.strip() for line in _read_content(path).split("\n"))
+        requirements_by_path[path] = [line for line in lines if line and not line.startswith("#")]
+    return requirements_by_path
 
 
-version = _read_content("VERSION").strip()
-requirements = _read_content("requirements.txt").splitlines()
-test_requirements = _read_content("test-requirements.txt").splitlines()
-doc_requirements = _read_content("doc/requirements.txt").splitlines()
-long_description = _read_content("README.md")
+@lru_cache(maxsize=None)
+def _read_version() -> str:
+    with open(os.path.join(_HERE, "VERSION"), "rb") as f:
+        return f.readline().decode("utf-8").strip()
 
 
 class build_py(_build_py):
@@ -49,7 +129,7 @@ def _stamp_version(filename: str) -> None:
         with open(filename) as f:
             for line in f:
                 if "__version__ =" in line:
-                    line = line.replace('"git"', "'%s'" % version)
+                    line = line.replace('"git"', "'%s'" % _read_version())
                     found = True
                 out.append(line)
     except OSError:
@@ -62,52 +142,34 @@ def _stamp_version(filename: str) -> None:
         print("WARNING: Couldn't find version line in file %s" % filename, file=sys.stderr)
 
 
-setup(
-    name="GitPython",
-    cmdclass={"build_py": build_py, "sdist": sdist},
-    version=version,
-    description="GitPython is a Python library used to interact with Git repositories",
-    author="Sebastian Thiel, Michael Trier",
-    author_email="byronimo@gmail.com, mtrier@gmail.com",
-    license="BSD-3-Clause",
-    url="https://github.com/gitpython-developers/GitPython",
-    packages=find_packages(exclude=["test", "test.*"]),
-    include_package_data=True,
-    package_dir={"git": "git"},
-    python_requires=">=3.7",
-    install_requires=requirements,
-    extras_require={
-        "test": test_requirements,
-        "doc": doc_requirements,
-    },
-    zip_safe=False,
-    long_description=long_description,
-    long_description_content_type="text/markdown",
-    classifiers=[
-        # Picked from
-        #   http://pypi.python.org/pypi?:action=list_classifiers
-        # "Development Status :: 1 - Planning",
-        # "Development Status :: 2 - Pre-Alpha",
-        # "Development Status :: 3 - Alpha",
-        # "Development Status :: 4 - Beta",
-        "Development Status :: 5 - Production/Stable",
-        # "Development Status :: 6 - Mature",
-        # "Development Status :: 7 - Inactive",
-        "Environment :: Console",
-        "Intended Audience :: Developers",
-        "License :: OSI Approved :: BSD License",
-        "Operating System :: OS Independent",
-        "Operating System :: POSIX",
-        "Operating System :: Microsoft :: Windows",
-        "Operating System :: MacOS :: MacOS X",
-        "Typing :: Typed",
-        "Programming Language :: Python",
-        "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
-        "Programming Language :: Python :: 3.8",
-        "Programming Language :: Python :: 3.9",
-        "Programming Language :: Python :: 3.10",
-        "Programming Language :: Python :: 3.11",
-        "Programming Language :: Python :: 3.12",
-    ],
-)
+def main() -> None:
+    requirements = _read_requirements_many(("requirements.txt", "test-requirements.txt", "doc/requirements.txt"))
+    args = sys.argv[1:]
+    long_description = "" if args and _QUERY_OPTIONS.issuperset(args) else _read_content("README.md")
+
+    setup(
+        name="GitPython",
+        cmdclass={"build_py": build_py, "sdist": sdist},
+        version=_read_version(),
+        description="GitPython is a Python library used to interact with Git repositories",
+        author="Sebastian Thiel, Michael Trier",
+        author_email="byronimo@gmail.com, mtrier@gmail.com",
+        license="BSD-3-Clause",
+        url="https://github.com/gitpython-developers/GitPython",
+        packages=list(_PACKAGES),
+        package_data=_PACKAGE_DATA,
+        python_requires=">=3.7",
+        install_requires=requirements["requirements.txt"],
+        extras_require={
+            "test": requirements["test-requirements.txt"],
+            "doc": requirements["doc/requirements.txt"],
+        },
+        zip_safe=False,
+        long_description=long_description,
+        long_description_content_type="text/markdown",
+        classifiers=list(_CLASSIFIERS),
+    )
+
+
+if __name__ == "__main__":
+    main()
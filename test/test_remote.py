@@ -3,10 +3,14 @@
 # This module is part of GitPython and is released under the
 # 3-Clause BSD License: https://opensource.org/license/bsd-3-clause/
 
+from concurrent.futures import ThreadPoolExecutor
 import gc
+import itertools
+import os
 import os.path as osp
-from pathlib import Path
 import random
+import shutil
+import subprocess
 import sys
 import tempfile
 from unittest import skipIf
@@ -23,6 +27,7 @@ from git import (
     Remote,
     RemoteProgress,
     RemoteReference,
+    Repo,
     SymbolicReference,
     TagReference,
 )
@@ -31,14 +36,108 @@ from git.exc import UnsafeOptionError, UnsafeProtocolError
 from git.util import HIDE_WINDOWS_FREEZE_ERRORS, IterableList, rmtree
 from test.lib import (
     GIT_DAEMON_PORT,
+    GIT_REPO,
     TestBase,
     fixture,
     with_rw_and_rw_remote_repo,
     with_rw_repo,
 )
 
-# Make sure we have repeatable results.
-random.seed(0)
+
+# URLs that Git.check_unsafe_protocols rejects. Format with pwn=<path> to get a URL
+# that, if Git ran it, would create that file.
+_UNSAFE_URL_TEMPLATES = ("ext::sh -c touch% {pwn}", "fd::17/foo")
+_UNSAFE_URL_IDS = ("ext", "fd")
+
+# Options that Git.check_unsafe_options rejects, for each operation. Give them the
+# value "touch <path>", a command that, if Git ran it, would create that file.
+_UNSAFE_OPTION_CASES = (
+    ("fetch", ("upload-pack",)),
+    ("pull", ("upload-pack",)),
+    ("push", ("receive-pack", "exec")),
+)
+_UNSAFE_OPTION_IDS = tuple(op for op, _ in _UNSAFE_OPTION_CASES)
+
+
+@pytest.fixture(scope="session")
+def rw_repo_template(tmp_path_factory):
+    """A clone of the test repository, checked out at HEAD, made once per session.
+
+    Tests that need their own writable repository get a copy of this, which is faster
+    than cloning and checking out again for every test.
+    """
+    rorepo = Repo(GIT_REPO)
+    try:
+        template = rorepo.clone(tmp_path_factory.mktemp("rw_repo_template") / "repo", shared=True, n=True)
+    finally:
+        rorepo.close()
+    template.head.reference.checkout()
+    yield template
+    template.close()
+
+
+def _cow_copy(src, dst):
+    """Copy the directory `src` to `dst`, sharing file data where the filesystem can.
+
+    On Linux (btrfs, XFS) and macOS (APFS), ``cp`` makes copy-on-write clones, which
+    take no time to copy file contents. Elsewhere, or if ``cp`` fails, this falls back
+    to :func:`shutil.copytree`.
+    """
+    if sys.platform == "linux":
+        command = ["cp", "-a", "--reflink=auto", src, dst]
+    elif sys.platform == "darwin":
+        command = ["cp", "-c", "-R", src, dst]
+    else:
+        command = None
+
+    if command is not None:
+        try:
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+        except (OSError, subprocess.CalledProcessError):
+            if osp.lexists(dst):
+                rmtree(dst)
+    shutil.copytree(src, dst, symlinks=True)
+
+
+def _copy_rw_repo_template(template, parent_dir):
+    repo_dir = parent_dir / "repo"
+    _cow_copy(template.working_dir, str(repo_dir))
+    return Repo(repo_dir)
+
+
+@pytest.fixture
+def rw_repo(rw_repo_template, tmp_path):
+    """A writable copy of :func:`rw_repo_template` for one test."""
+    repo = _copy_rw_repo_template(rw_repo_template, tmp_path)
+    yield repo
+    repo.close()
+
+
+@pytest.fixture(scope="class")
+def shared_rw_repo(rw_repo_template, tmp_path_factory):
+    """A copy of :func:`rw_repo_template` for a whole class of tests that don't change it."""
+    repo = _copy_rw_repo_template(rw_repo_template, tmp_path_factory.mktemp("shared_rw_repo"))
+    yield repo
+    repo.close()
+
+
+@pytest.fixture
+def origin_remote(rw_repo):
+    """The ``origin`` remote of :func:`rw_repo`."""
+    return rw_repo.remote("origin")
+
+
+@pytest.fixture(scope="class")
+def shared_origin_remote(shared_rw_repo):
+    """The ``origin`` remote of :func:`shared_rw_repo`."""
+    return shared_rw_repo.remote("origin")
+
+
+@pytest.fixture
+def pwn_path(tmp_path):
+    """A path that exploits of the unsafe URLs and options under test would create."""
+    return osp.join(tmp_path, "pwn")
 
 
 class TestRemoteProgress(RemoteProgress):
@@ -46,40 +145,50 @@ class TestRemoteProgress(RemoteProgress):
 
     def __init__(self):
         super().__init__()
-        self._seen_lines = []
+        # Counts of each line seen, so dropping one is O(1) rather than a list scan.
+        self._seen_lines = {}
         self._stages_per_op = {}
         self._num_progress_messages = 0
 
+    def reset(self):
+        """Forget what was recorded, so this instance can report another operation."""
+        RemoteProgress.__init__(self)
+        self._seen_lines.clear()
+        self._stages_per_op.clear()
+        self._num_progress_messages = 0
+
     def _parse_progress_line(self, line):
         # We may remove the line later if it is dropped.
         # Keep it for debugging.
-        self._seen_lines.append(line)
+        self._seen_lines[line] = self._seen_lines.get(line, 0) + 1
         rval = super()._parse_progress_line(line)
         return rval
 
     def line_dropped(self, line):
-        try:
-            self._seen_lines.remove(line)
-        except ValueError:
-            pass
+        count = self._seen_lines.pop(line, 0)
+        if count > 1:
+            self._seen_lines[line] = count - 1
 
     def update(self, op_code, cur_count, max_count=None, message=""):
+        # This runs for every progress line, so look the flags up only once.
+        WRITING, BEGIN, END = self.WRITING, self.BEGIN, self.END
+
         # Check each stage only comes once.
         op_id = op_code & self.OP_MASK
-        assert op_id in (self.COUNTING, self.COMPRESSING, self.WRITING)
+        assert op_id in (self.COUNTING, self.COMPRESSING, WRITING)
 
-        if op_code & self.WRITING > 0:
-            if op_code & self.BEGIN > 0:
+        if op_code & WRITING > 0:
+            if op_code & BEGIN > 0:
                 assert not message, "should not have message when remote begins writing"
-            elif op_code & self.END > 0:
+            elif op_code & END > 0:
                 assert message
                 assert not message.startswith(", "), "Sanitize progress messages: '%s'" % message
                 assert not message.endswith(", "), "Sanitize progress messages: '%s'" % message
 
-        self._stages_per_op.setdefault(op_id, 0)
-        self._stages_per_op[op_id] = self._stages_per_op[op_id] | (op_code & self.STAGE_MASK)
+        stages_per_op = self._stages_per_op
+        stages_per_op[op_id] = stages_per_op.get(op_id, 0) | (op_code & self.STAGE_MASK)
 
-        if op_code & (self.WRITING | self.END) == (self.WRITING | self.END):
+        if op_code & (WRITING | END) == (WRITING | END):
             assert message
         # END check we get message
 
@@ -104,15 +213,43 @@ class TestRemoteProgress(RemoteProgress):
 
 
 class TestRemote(TestBase):
-    def tearDown(self):
-        gc.collect()
+    # Unique names for _commit_random_file, without probing the filesystem for them.
+    _random_file_numbers = itertools.count()
+
+    # Random file contents for _commit_random_file. This generator is seeded and
+    # used by nothing else, so results are repeatable.
+    _random_file_contents = random.Random(0)
+
+    # Line formats for test_fetch_info.
+    _fetch_info_line_fmt = (
+        "c437ee5deb8d00cf02f03720693e4c802e99f390\tnot-for-merge\t%s '0.3' of "
+        "git://github.com/gitpython-developers/GitPython"
+    )
+    _remote_info_line_fmt = "* [new branch]      nomatter     -> %s"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Deletes scratch repos off the critical path of the tests that made them.
+        cls._rmtree_executor = ThreadPoolExecutor(max_workers=1)
+        cls._rmtree_futures = []
+        # Fetch output for branches from a custom refspec: +refs/pull/*:refs/heads/pull/*
+        stderr_lines = fixture("uncommon_branch_prefix_stderr").decode("ascii").splitlines()
+        fetch_lines = fixture("uncommon_branch_prefix_FETCH_HEAD").decode("ascii").splitlines()
+        cls._uncommon_branch_line_pairs = tuple(zip(stderr_lines, fetch_lines))
 
-    def _print_fetchhead(self, repo):
-        with open(osp.join(repo.git_dir, "FETCH_HEAD")):
-            pass
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            cls._rmtree_executor.shutdown(wait=True)
+            for future in cls._rmtree_futures:
+                future.result()  # Report any failure to delete.
+        finally:
+            super().tearDownClass()
+            # The rw repo decorators already collect before deleting each test's repos.
+            gc.collect()
 
     def _do_test_fetch_result(self, results, remote):
-        # self._print_fetchhead(remote.repo)
         self.assertGreater(len(results), 0)
         self.assertIsInstance(results[0], FetchInfo)
         for info in results:
@@ -129,14 +266,14 @@ class TestRemote(TestBase):
         # END for each info
 
     def _do_test_push_result(self, results, remote):
-        self.assertIsInstance(results, list)
+        # IterableList is a list subclass, so this also checks that it is a list.
         self.assertIsInstance(results, IterableList)
 
         self.assertGreater(len(results), 0)
         self.assertIsInstance(results[0], PushInfo)
+        self.assertTrue(all(isinstance(info.summary, str) for info in results))
         for info in results:
             self.assertTrue(info.flags)
-            self.assertIsInstance(info.summary, str)
             if info.old_commit is not None:
                 self.assertIsInstance(info.old_commit, Commit)
             if info.flags & info.ERROR:
@@ -181,17 +318,39 @@ class TestRemote(TestBase):
         :return: The committed absolute file path.
         """
         index = repo.index
-        new_file = self._make_file(osp.basename(tempfile.mktemp()), str(random.random()), repo)
+        filename = "random_file_%d" % next(self._random_file_numbers)
+        data = "%032x" % self._random_file_contents.getrandbits(128)
+        new_file = self._make_file(filename, data, repo)
         index.add([new_file])
-        index.commit("Committing %s" % new_file)
+        # Adding and committing write objects in-process; only hooks would need a
+        # subprocess, and these throwaway commits have no use for them.
+        index.commit("Committing %s" % new_file, skip_hooks=True)
         return new_file
 
+    def _configure_cheap_fetch(self, repo):
+        """Configure a repo to do less ref negotiation when fetching.
+
+        The repos here borrow objects from the shared repos they were cloned from, so
+        git would otherwise list and negotiate over all the refs of those, too. Setting
+        ``core.alternateRefsCommand`` to a command that prints nothing hides those refs.
+
+        This also sets ``fetch.negotiationAlgorithm`` to ``skipping``, which sends fewer
+        "have" lines for the repo's own history. It only changes how many round trips
+        the fetch takes, not which objects or refs it ends up with.
+        """
+        with repo.config_writer() as writer:
+            writer.set_value("core", "alternateRefsCommand", "true")
+            writer.set_value("fetch", "negotiationAlgorithm", "skipping")
+
     def _do_test_fetch(self, remote, rw_repo, remote_repo, **kwargs):
         """Specialized fetch testing to de-clutter the main test."""
         self._do_test_fetch_info(rw_repo)
+        self._configure_cheap_fetch(rw_repo)
+
+        progress = TestRemoteProgress()
 
         def fetch_and_test(remote, **kwargs):
-            progress = TestRemoteProgress()
+            progress.reset()
             kwargs["progress"] = progress
             res = remote.fetch(**kwargs)
             progress.make_assertion()
@@ -252,12 +411,13 @@ class TestRemote(TestBase):
         RemoteReference.delete(rw_repo, *stale_refs)
 
         # Test single branch fetch with refspec including target remote.
-        res = fetch_and_test(remote, refspec="master:refs/remotes/%s/master" % remote)
+        # Tag following is disabled, as only the one branch is of interest.
+        res = fetch_and_test(remote, refspec="master:refs/remotes/%s/master" % remote, no_tags=True)
         self.assertEqual(len(res), 1)
         self.assertTrue(get_info(res, remote, "master"))
 
         # ...with respec and no target.
-        res = fetch_and_test(remote, refspec="master")
+        res = fetch_and_test(remote, refspec="master", no_tags=True)
         self.assertEqual(len(res), 1)
 
         # ...multiple refspecs...works, but git command returns with error if one ref is
@@ -277,9 +437,10 @@ class TestRemote(TestBase):
         Reference.set_object(rtag, rhead.commit.parents[0].parents[0])
 
         # As of git 2.20 one cannot clobber local tags that have changed without
-        # specifying --force, and the test assumes you can clobber, so...
+        # specifying --force, and the test assumes you can clobber, so... The version
+        # is asked of rorepo, whose Git instance caches it across the whole class.
         force = None
-        if rw_repo.git.version_info[:2] >= (2, 20):
+        if self.rorepo.git.version_info[:2] >= (2, 20):
             force = True
         res = fetch_and_test(remote, tags=True, force=force)
         tinfo = res[str(rtag)]
@@ -295,10 +456,11 @@ class TestRemote(TestBase):
         # expect. For that we need a remote transport protocol.
         # Create a new UN-shared repo and fetch into it after we pushed a change to the
         # shared repo.
-        other_repo_dir = tempfile.mktemp("other_repo")
+        other_repo_dir = tempfile.mkdtemp(prefix="other_repo")
         # Must clone with a local path for the repo implementation not to freak out as
         # it wants local paths only (which I can understand).
         other_repo = remote_repo.clone(other_repo_dir, shared=False)
+        self._configure_cheap_fetch(other_repo)
         remote_repo_url = osp.basename(remote_repo.git_dir)  # git-daemon runs with appropriate `--base-path`.
         remote_repo_url = Git.polish_url("git://localhost:%s/%s" % (GIT_DAEMON_PORT, remote_repo_url))
 
@@ -322,7 +484,8 @@ class TestRemote(TestBase):
             # ttys.
             res = fetch_and_test(other_origin)
         finally:
-            rmtree(other_repo_dir)
+            other_repo.git.clear_cache()
+            self._rmtree_futures.append(self._rmtree_executor.submit(rmtree, other_repo_dir))
         # END test and cleanup
 
     def _assert_push_and_pull(self, remote, rw_repo, remote_repo):
@@ -344,7 +507,7 @@ class TestRemote(TestBase):
 
         # Simple file push.
         self._commit_random_file(rw_repo)
-        progress = TestRemoteProgress()
+        progress = TestRemoteProgress()  # Reset and reused for each push that checks it.
         res = remote.push(lhead.reference, progress)
         self.assertIsInstance(res, list)
         self._do_test_push_result(res, remote)
@@ -367,7 +530,7 @@ class TestRemote(TestBase):
         self.assertRaises(GitCommandError, remote.push, "hellothere")
 
         # Push new tags.
-        progress = TestRemoteProgress()
+        progress.reset()
         to_be_updated = "my_tag.1.0RV"
         new_tag = TagReference.create(rw_repo, to_be_updated)  # @UnusedVariable
         other_tag = TagReference.create(rw_repo, "my_obj_tag.2.1aRV", logmsg="my message")
@@ -399,7 +562,7 @@ class TestRemote(TestBase):
 
         # Push new branch.
         new_head = Head.create(rw_repo, "my_new_branch")
-        progress = TestRemoteProgress()
+        progress.reset()
         res = remote.push(new_head, progress)
         self.assertGreater(len(res), 0)
         self.assertTrue(res[0].flags & PushInfo.NEW_HEAD)
@@ -493,8 +656,6 @@ class TestRemote(TestBase):
                 self._do_test_fetch(remote, rw_repo, remote_repo, kill_after_timeout=10.0)
                 ran_fetch_test = True
             # END fetch test
-
-            remote.update()
         # END for each remote
 
         self.assertTrue(ran_fetch_test)
@@ -503,6 +664,8 @@ class TestRemote(TestBase):
 
         origin = rw_repo.remote("origin")
         assert origin == rw_repo.remotes.origin
+        # Once is enough to check that updating works; the remotes share one repo.
+        self.assertIs(origin.update(), origin)
 
         # Verify we can handle prunes when fetching.
         # stderr lines look like this:  x [deleted]         (none)     -> origin/experiment-2012
@@ -554,9 +717,8 @@ class TestRemote(TestBase):
 
     def test_fetch_info(self):
         # Ensure we can handle remote-tracking branches.
-        fetch_info_line_fmt = "c437ee5deb8d00cf02f03720693e4c802e99f390	not-for-merge	%s '0.3' of "
-        fetch_info_line_fmt += "git://github.com/gitpython-developers/GitPython"
-        remote_info_line_fmt = "* [new branch]      nomatter     -> %s"
+        fetch_info_line_fmt = self._fetch_info_line_fmt
+        remote_info_line_fmt = self._remote_info_line_fmt
 
         self.assertRaises(
             ValueError,
@@ -624,14 +786,10 @@ class TestRemote(TestBase):
         self.assertEqual(fi.ref.path, "refs/something/branch")
 
     def test_uncommon_branch_names(self):
-        stderr_lines = fixture("uncommon_branch_prefix_stderr").decode("ascii").splitlines()
-        fetch_lines = fixture("uncommon_branch_prefix_FETCH_HEAD").decode("ascii").splitlines()
-
-        # The contents of the files above must be fetched with a custom refspec:
-        # +refs/pull/*:refs/heads/pull/*
+        from_line = FetchInfo._from_line
         res = [
-            FetchInfo._from_line("ShouldntMatterRepo", stderr, fetch_line)
-            for stderr, fetch_line in zip(stderr_lines, fetch_lines)
+            from_line("ShouldntMatterRepo", stderr, fetch_line)
+            for stderr, fetch_line in self._uncommon_branch_line_pairs
         ]
         self.assertGreater(len(res), 0)
         self.assertEqual(res[0].remote_ref_path, "refs/pull/1/head")
@@ -645,22 +803,28 @@ class TestRemote(TestBase):
         test2 = "https://github.com/gitpython-developers/gitdb"
         test3 = "https://github.com/gitpython-developers/smmap"
 
+        def configured_urls(remote):
+            # Reading the config in-process avoids running git for each intermediate
+            # check. remote.urls, which runs git, is checked at the end of each scenario.
+            reader = rw_repo.config_reader("repository")
+            return reader.get_values('remote "%s"' % remote.name, "url")
+
         remote = rw_repo.remotes[0]
         # Test setting a single URL.
         remote.set_url(test1)
-        self.assertEqual(list(remote.urls), [test1])
+        self.assertEqual(configured_urls(remote), [test1])
 
         # Test replacing that single URL.
         remote.set_url(test1)
-        self.assertEqual(list(remote.urls), [test1])
+        self.assertEqual(configured_urls(remote), [test1])
         # Test adding new URLs.
         remote.set_url(test2, add=True)
-        self.assertEqual(list(remote.urls), [test1, test2])
+        self.assertEqual(configured_urls(remote), [test1, test2])
         remote.set_url(test3, add=True)
-        self.assertEqual(list(remote.urls), [test1, test2, test3])
+        self.assertEqual(configured_urls(remote), [test1, test2, test3])
         # Test removing a URL.
         remote.set_url(test2, delete=True)
-        self.assertEqual(list(remote.urls), [test1, test3])
+        self.assertEqual(configured_urls(remote), [test1, test3])
         # Test changing a URL.
         remote.set_url(test2, test3)
         self.assertEqual(list(remote.urls), [test1, test2])
@@ -671,12 +835,12 @@ class TestRemote(TestBase):
         # Test on another remote, with the add/delete URL.
         remote = rw_repo.create_remote("another", url=test1)
         remote.add_url(test2)
-        self.assertEqual(list(remote.urls), [test1, test2])
+        self.assertEqual(configured_urls(remote), [test1, test2])
         remote.add_url(test3)
-        self.assertEqual(list(remote.urls), [test1, test2, test3])
+        self.assertEqual(configured_urls(remote), [test1, test2, test3])
         # Test removing all the URLs.
         remote.delete_url(test2)
-        self.assertEqual(list(remote.urls), [test1, test3])
+        self.assertEqual(configured_urls(remote), [test1, test3])
         remote.delete_url(test1)
         self.assertEqual(list(remote.urls), [test3])
         # Will raise fatal: Will not delete all non-push URLs.
@@ -694,78 +858,29 @@ class TestRemote(TestBase):
             rem.push("__BAD_REF__")
 
     @with_rw_repo("HEAD")
-    def test_set_unsafe_url(self, rw_repo):
+    def test_set_add_and_create_unsafe_url(self, rw_repo):
+        # These operations only change the configuration, so one repo serves them all.
         with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
+            tmp_file = osp.join(tdir, "pwn")
             remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
+            urls = [template.format(pwn=tmp_file) for template in _UNSAFE_URL_TEMPLATES]
             for url in urls:
                 with self.assertRaises(UnsafeProtocolError):
                     remote.set_url(url)
-                assert not tmp_file.exists()
+                with self.assertRaises(UnsafeProtocolError):
+                    remote.add_url(url)
+                with self.assertRaises(UnsafeProtocolError):
+                    Remote.create(rw_repo, "origin", url)
 
-    @with_rw_repo("HEAD")
-    def test_set_unsafe_url_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
+            # These change the URLs, so they come after the blocked cases. Setting must
+            # also precede adding, since set_url fails once there are several URLs.
             for url in urls:
                 remote.set_url(url, allow_unsafe_protocols=True)
                 assert list(remote.urls)[-1] == url
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_add_unsafe_url(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                with self.assertRaises(UnsafeProtocolError):
-                    remote.add_url(url)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_add_unsafe_url_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
             for url in urls:
                 remote.add_url(url, allow_unsafe_protocols=True)
                 assert list(remote.urls)[-1] == url
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_create_remote_unsafe_url(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                with self.assertRaises(UnsafeProtocolError):
-                    Remote.create(rw_repo, "origin", url)
-                assert not tmp_file.exists()
+            assert not osp.exists(tmp_file)
 
     @pytest.mark.xfail(
         sys.platform == "win32",
@@ -775,231 +890,12 @@ class TestRemote(TestBase):
     @with_rw_repo("HEAD")
     def test_create_remote_unsafe_url_allowed(self, rw_repo):
         with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
+            tmp_file = osp.join(tdir, "pwn")
+            urls = [template.format(pwn=tmp_file) for template in _UNSAFE_URL_TEMPLATES]
             for i, url in enumerate(urls):
                 remote = Remote.create(rw_repo, f"origin{i}", url, allow_unsafe_protocols=True)
                 assert remote.url == url
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_fetch_unsafe_url(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                with self.assertRaises(UnsafeProtocolError):
-                    remote.fetch(url)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_fetch_unsafe_url_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                # The URL will be allowed into the command, but the command will fail
-                # since we don't have that protocol enabled in the Git config file.
-                with self.assertRaises(GitCommandError):
-                    remote.fetch(url, allow_unsafe_protocols=True)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_fetch_unsafe_options(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [{"upload-pack": f"touch {tmp_file}"}]
-            for unsafe_option in unsafe_options:
-                with self.assertRaises(UnsafeOptionError):
-                    remote.fetch(**unsafe_option)
-                assert not tmp_file.exists()
-
-    @pytest.mark.xfail(
-        sys.platform == "win32",
-        reason=(
-            "File not created. A separate Windows command may be needed. This and the "
-            "currently passing test test_fetch_unsafe_options must be adjusted in the "
-            "same way. Until then, test_fetch_unsafe_options is unreliable on Windows."
-        ),
-        raises=AssertionError,
-    )
-    @with_rw_repo("HEAD")
-    def test_fetch_unsafe_options_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [{"upload-pack": f"touch {tmp_file}"}]
-            for unsafe_option in unsafe_options:
-                # The options will be allowed, but the command will fail.
-                assert not tmp_file.exists()
-                with self.assertRaises(GitCommandError):
-                    remote.fetch(**unsafe_option, allow_unsafe_options=True)
-                assert tmp_file.exists()
-                tmp_file.unlink()
-
-    @with_rw_repo("HEAD")
-    def test_pull_unsafe_url(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                with self.assertRaises(UnsafeProtocolError):
-                    remote.pull(url)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_pull_unsafe_url_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                # The URL will be allowed into the command, but the command will fail
-                # since we don't have that protocol enabled in the Git config file.
-                with self.assertRaises(GitCommandError):
-                    remote.pull(url, allow_unsafe_protocols=True)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_pull_unsafe_options(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [{"upload-pack": f"touch {tmp_file}"}]
-            for unsafe_option in unsafe_options:
-                with self.assertRaises(UnsafeOptionError):
-                    remote.pull(**unsafe_option)
-                assert not tmp_file.exists()
-
-    @pytest.mark.xfail(
-        sys.platform == "win32",
-        reason=(
-            "File not created. A separate Windows command may be needed. This and the "
-            "currently passing test test_pull_unsafe_options must be adjusted in the "
-            "same way. Until then, test_pull_unsafe_options is unreliable on Windows."
-        ),
-        raises=AssertionError,
-    )
-    @with_rw_repo("HEAD")
-    def test_pull_unsafe_options_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [{"upload-pack": f"touch {tmp_file}"}]
-            for unsafe_option in unsafe_options:
-                # The options will be allowed, but the command will fail.
-                assert not tmp_file.exists()
-                with self.assertRaises(GitCommandError):
-                    remote.pull(**unsafe_option, allow_unsafe_options=True)
-                assert tmp_file.exists()
-                tmp_file.unlink()
-
-    @with_rw_repo("HEAD")
-    def test_push_unsafe_url(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                with self.assertRaises(UnsafeProtocolError):
-                    remote.push(url)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_push_unsafe_url_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            remote = rw_repo.remote("origin")
-            urls = [
-                f"ext::sh -c touch% {tmp_file}",
-                "fd::17/foo",
-            ]
-            for url in urls:
-                # The URL will be allowed into the command, but the command will fail
-                # since we don't have that protocol enabled in the Git config file.
-                with self.assertRaises(GitCommandError):
-                    remote.push(url, allow_unsafe_protocols=True)
-                assert not tmp_file.exists()
-
-    @with_rw_repo("HEAD")
-    def test_push_unsafe_options(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [
-                {
-                    "receive-pack": f"touch {tmp_file}",
-                    "exec": f"touch {tmp_file}",
-                }
-            ]
-            for unsafe_option in unsafe_options:
-                assert not tmp_file.exists()
-                with self.assertRaises(UnsafeOptionError):
-                    remote.push(**unsafe_option)
-                assert not tmp_file.exists()
-
-    @pytest.mark.xfail(
-        sys.platform == "win32",
-        reason=(
-            "File not created. A separate Windows command may be needed. This and the "
-            "currently passing test test_push_unsafe_options must be adjusted in the "
-            "same way. Until then, test_push_unsafe_options is unreliable on Windows."
-        ),
-        raises=AssertionError,
-    )
-    @with_rw_repo("HEAD")
-    def test_push_unsafe_options_allowed(self, rw_repo):
-        with tempfile.TemporaryDirectory() as tdir:
-            remote = rw_repo.remote("origin")
-            tmp_dir = Path(tdir)
-            tmp_file = tmp_dir / "pwn"
-            unsafe_options = [
-                {
-                    "receive-pack": f"touch {tmp_file}",
-                    "exec": f"touch {tmp_file}",
-                }
-            ]
-            for unsafe_option in unsafe_options:
-                # The options will be allowed, but the command will fail.
-                assert not tmp_file.exists()
-                with self.assertRaises(GitCommandError):
-                    remote.push(**unsafe_option, allow_unsafe_options=True)
-                assert tmp_file.exists()
-                tmp_file.unlink()
+            assert not osp.exists(tmp_file)
 
     @with_rw_and_rw_remote_repo("0.1.6")
     def test_fetch_unsafe_branch_name(self, rw_repo, remote_repo):
@@ -1018,17 +914,72 @@ class TestRemote(TestBase):
         Head.delete(remote_repo, bad_branch_name)
 
 
-class TestTimeouts(TestBase):
-    @with_rw_repo("HEAD", bare=False)
-    def test_timeout_funcs(self, repo):
+class TestUnsafeRemoteOperations:
+    """Tests that fetch, pull, and push refuse unsafe URLs and options by default."""
+
+    @pytest.mark.parametrize("url_template", _UNSAFE_URL_TEMPLATES, ids=_UNSAFE_URL_IDS)
+    def test_check_unsafe_protocols(self, url_template):
+        # The validator alone, without a repository or any file I/O. test_unsafe_url
+        # checks that each operation calls it.
+        with pytest.raises(UnsafeProtocolError):
+            Git.check_unsafe_protocols(url_template.format(pwn="pwn"))
+
+    @pytest.mark.parametrize("url_template", _UNSAFE_URL_TEMPLATES, ids=_UNSAFE_URL_IDS)
+    @pytest.mark.parametrize("op", ["fetch", "pull", "push"])
+    def test_unsafe_url(self, shared_origin_remote, op, url_template, pwn_path):
+        method = getattr(shared_origin_remote, op)
+        with pytest.raises(UnsafeProtocolError):
+            method(url_template.format(pwn=pwn_path))
+        assert not osp.exists(pwn_path)
+
+    @pytest.mark.slow
+    @pytest.mark.skipif(
+        "GIT_ALLOW_PROTOCOL" in os.environ,
+        reason="GIT_ALLOW_PROTOCOL may enable the protocol, so git would not fail as expected.",
+    )
+    @pytest.mark.parametrize("url_template", _UNSAFE_URL_TEMPLATES, ids=_UNSAFE_URL_IDS)
+    @pytest.mark.parametrize("op", ["fetch", "pull", "push"])
+    def test_unsafe_url_allowed(self, shared_origin_remote, op, url_template, pwn_path):
+        method = getattr(shared_origin_remote, op)
+        # The URL will be allowed into the command, but the command will fail
+        # since we don't have that protocol enabled in the Git config file.
+        with pytest.raises(GitCommandError):
+            method(url_template.format(pwn=pwn_path), allow_unsafe_protocols=True)
+        assert not osp.exists(pwn_path)
+
+    @pytest.mark.parametrize("op, option_names", _UNSAFE_OPTION_CASES, ids=_UNSAFE_OPTION_IDS)
+    def test_unsafe_options(self, shared_origin_remote, op, option_names, pwn_path):
+        unsafe_options = dict.fromkeys(option_names, f"touch {pwn_path}")
+        with pytest.raises(UnsafeOptionError):
+            getattr(shared_origin_remote, op)(**unsafe_options)
+        assert not osp.exists(pwn_path)
+
+    @pytest.mark.xfail(
+        sys.platform == "win32",
+        reason=(
+            "File not created. A separate Windows command may be needed. This and the "
+            "currently passing test test_unsafe_options must be adjusted in the "
+            "same way. Until then, test_unsafe_options is unreliable on Windows."
+        ),
+        raises=AssertionError,
+    )
+    @pytest.mark.slow
+    @pytest.mark.parametrize("op, option_names", _UNSAFE_OPTION_CASES, ids=_UNSAFE_OPTION_IDS)
+    def test_unsafe_options_allowed(self, origin_remote, op, option_names, pwn_path):
+        unsafe_options = dict.fromkeys(option_names, f"touch {pwn_path}")
+        # The options will be allowed, but the command will fail.
+        with pytest.raises(GitCommandError):
+            getattr(origin_remote, op)(**unsafe_options, allow_unsafe_options=True)
+        assert osp.exists(pwn_path)
+        os.unlink(pwn_path)
+
+
+class TestTimeouts:
+    @pytest.mark.parametrize("function", ["pull", "fetch"])  # Can't get push to time out.
+    def test_timeout_funcs(self, origin_remote, monkeypatch, function):
         # Force error code to prevent a race condition if the python thread is slow.
-        default = Git.AutoInterrupt._status_code_if_terminate
-        Git.AutoInterrupt._status_code_if_terminate = -15
-        for function in ["pull", "fetch"]:  # Can't get push to time out.
-            f = getattr(repo.remotes.origin, function)
-            assert f is not None  # Make sure these functions exist.
-            _ = f()  # Make sure the function runs.
-            with pytest.raises(GitCommandError, match="kill_after_timeout=0 s"):
-                f(kill_after_timeout=0)
-
-        Git.AutoInterrupt._status_code_if_terminate = default
+        monkeypatch.setattr(Git.AutoInterrupt, "_status_code_if_terminate", -15)
+        f = getattr(origin_remote, function)
+        assert callable(f)  # Make sure these functions exist.
+        with pytest.raises(GitCommandError, match="kill_after_timeout=0 s"):
+            f(kill_after_timeout=0)